@@ -1,24 +1,74 @@
 import os
 import pandas as pd
 import geopandas as gpd
+import pyarrow as pa
+import shapely
 from shapely.geometry import Point
-import tempfile
 import shutil
+import tempfile
 from datetime import datetime
+import argparse
+import hashlib
 import json
 import io
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
 
+# Pré-processamento das referências espaciais (graus, EPSG:4326)
+# Tolerância de simplificação ~11 m: bem abaixo do pixel dos sensores (375 m - 1 km)
+SIMPLIFY_TOLERANCE = 0.0001
+# Grade de precisão ~0,1 m: vértices mais próximos que isso são removidos
+PRECISION_GRID = 0.000001
+# Camadas de cobertura (polígonos vizinhos com bordas compartilhadas): não são
+# simplificadas, pois a simplificação por polígono abriria lacunas e sobreposições
+COVERAGE_LAYERS = {'uf', 'municipios', 'biomas', 'uso_solo', 'zee'}
+# Cache persistente entre execuções (restaurado pelo GitHub Actions)
+CACHE_DIR = os.environ.get('FOCOS_CACHE_DIR', os.path.join('cache', 'referencias'))
+# Margem (graus) do retângulo de cada UF no modo nacional
+BBOX_MARGIN = 0.01
+# Quantidade de focos usada para medir o ganho de desempenho do join
+BENCHMARK_SAMPLE = 2000
+# Linhas por lote ao gravar etapas em Arrow (limita a memória extra da gravação)
+STAGE_BATCH_ROWS = 100000
+# Diretório das execuções (uma subpasta por execução), preservadas em caso de falha para --resume
+RUN_DIR = os.environ.get('FOCOS_RUN_DIR', os.path.join('cache', 'execucao'))
+
 class FocosCalorProcessor:
-    def __init__(self, credentials_path='credentials.json'):
-        """Inicializa o processador com as credenciais do Google Drive"""
-        self.setup_drive_service(credentials_path)
-        self.temp_dir = tempfile.mkdtemp()
+    def __init__(self, credentials_path='credentials.json', temp_dir=None, resume=False):
+        """Inicializa o processador com as credenciais do Google Drive
+        
+        Sem credenciais (credentials_path=None) o processador trabalha apenas
+        localmente, como nos workers do modo nacional. Sem temp_dir cada execução
+        cria a própria subpasta em RUN_DIR; com resume=True é reaberta a
+        execução interrompida mais recente.
+        """
+        self.drive_service = None
+        if credentials_path:
+            self.setup_drive_service(credentials_path)
+        self.resume = resume
+        if temp_dir:
+            self.temp_dir = temp_dir
+        else:
+            self.temp_dir = self.find_resumable_run() if resume else None
+            if self.temp_dir is None:
+                if resume:
+                    print("⚠️ Nenhuma execução interrompida encontrada - iniciando nova execução")
+                os.makedirs(RUN_DIR, exist_ok=True)
+                self.temp_dir = tempfile.mkdtemp(
+                    prefix=datetime.now().strftime("%Y%m%d_%H%M%S_"), dir=RUN_DIR
+                )
+            print(f"📁 Diretório de execução: {self.temp_dir}")
+        self.stages_dir = os.path.join(self.temp_dir, 'stages')
+        self.manifest_path = os.path.join(self.stages_dir, 'manifest.json')
+        self.manifest = self.load_manifest()
         self.dados_processados = None  # Para rastrear dados processados
-        print(f"📁 Diretório temporário criado: {self.temp_dir}")
+        self.cache_utilizado = set()  # Arquivos do cache de referências usados nesta execução
         
     def setup_drive_service(self, credentials_path):
         """Configura o serviço do Google Drive"""
@@ -29,6 +79,130 @@ class FocosCalorProcessor:
         self.drive_service = build('drive', 'v3', credentials=creds)
         print("✅ Conexão com Google Drive estabelecida")
         
+    def find_resumable_run(self):
+        """Encontra a execução interrompida mais recente em RUN_DIR"""
+        if not os.path.isdir(RUN_DIR):
+            return None
+        execucoes = []
+        for nome in os.listdir(RUN_DIR):
+            manifest_path = os.path.join(RUN_DIR, nome, 'stages', 'manifest.json')
+            if os.path.isfile(manifest_path):
+                execucoes.append((os.path.getmtime(manifest_path), os.path.join(RUN_DIR, nome)))
+        return max(execucoes)[1] if execucoes else None
+        
+    def load_manifest(self):
+        """Carrega o registro de etapas concluídas (apenas com resume)"""
+        if not self.resume or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            print(f"♻️ Retomando execução: etapas concluídas {list(manifest.keys())}")
+            return manifest
+        except Exception as e:
+            print(f"⚠️ Manifesto inválido, reiniciando etapas: {e}")
+            return {}
+            
+    def check_resume_inputs(self, files):
+        """Registra os CSVs de entrada e descarta etapas salvas com outros arquivos
+        
+        Evita que um --resume exporte resultados de dados que já mudaram no Drive.
+        """
+        entradas = sorted(
+            ({"id": f['id'], "name": f['name'], "modifiedTime": f.get('modifiedTime')} for f in files),
+            key=lambda f: f['id']
+        )
+        if self.manifest and self.manifest.get('entradas', {}).get('arquivos') != entradas:
+            print("⚠️ Arquivos de focos mudaram no Drive desde a execução interrompida - etapas descartadas")
+            # As referências espaciais não dependem dos CSVs e podem ser reaproveitadas
+            self.manifest = {k: v for k, v in self.manifest.items() if k == 'referencias'}
+        self.mark_stage('entradas', {"arquivos": entradas})
+        
+    def mark_stage(self, nome, info):
+        """Registra uma etapa como concluída no manifesto"""
+        self.manifest[nome] = dict(info, concluido_em=datetime.now().isoformat())
+        os.makedirs(self.stages_dir, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+            
+    def save_stage(self, nome, df):
+        """Grava a saída de uma etapa em Arrow IPC para permitir --resume
+        
+        A gravação é feita em lotes de STAGE_BATCH_ROWS linhas, então a memória
+        extra fica limitada a um lote. Durante a execução a etapa seguinte
+        continua usando o objeto em memória; o arquivo só é lido ao retomar.
+        A geometria de GeoDataFrames é gravada em WKB.
+        """
+        path = os.path.join(self.stages_dir, f"{nome}.arrow")
+        os.makedirs(self.stages_dir, exist_ok=True)
+        is_geo = isinstance(df, gpd.GeoDataFrame)
+        try:
+            self.normalize_object_columns(df)
+            writer = None
+            schema = None
+            try:
+                for inicio in range(0, max(len(df), 1), STAGE_BATCH_ROWS):
+                    lote = df.iloc[inicio:inicio + STAGE_BATCH_ROWS]
+                    if is_geo:
+                        wkb = shapely.to_wkb(lote.geometry.to_numpy())
+                        lote = pd.DataFrame(lote.drop(columns=lote.geometry.name))
+                        lote["geometry"] = wkb
+                    if schema is None:
+                        schema = self.stage_schema(lote)
+                        writer = pa.ipc.new_file(path, schema)
+                    writer.write_table(pa.Table.from_pandas(lote, schema=schema, preserve_index=False))
+            finally:
+                if writer is not None:
+                    writer.close()
+                    
+            self.mark_stage(nome, {
+                "arquivo": path,
+                "registros": len(df),
+                "geo": is_geo,
+                "crs": df.crs.to_string() if is_geo and df.crs is not None else None
+            })
+            print(f"💾 Etapa '{nome}' salva: {path}")
+        except Exception as e:
+            if os.path.exists(path):
+                os.remove(path)
+            print(f"⚠️ Erro ao salvar etapa '{nome}': {e}")
+            print(f"   ⚠️ --resume não poderá retomar a partir desta etapa")
+            
+    def stage_schema(self, lote):
+        """Monta o schema Arrow de uma etapa a partir do primeiro lote
+        
+        Colunas de texto são fixadas como string: um lote só com nulos não
+        pode mudar o tipo da coluna nos lotes seguintes.
+        """
+        schema = pa.Schema.from_pandas(lote, preserve_index=False)
+        campos = [
+            pa.field(campo.name, pa.string())
+            if campo.name != "geometry" and lote[campo.name].dtype == object else campo
+            for campo in schema
+        ]
+        return pa.schema(campos, metadata=schema.metadata)
+        
+    def load_stage(self, nome):
+        """Lê uma etapa concluída via mmap; retorna None se ela não existir
+        
+        As colunas numéricas podem ser lidas sem cópia; textos são copiados
+        e a geometria é decodificada de WKB.
+        """
+        info = self.manifest.get(nome)
+        if not info or not os.path.exists(info['arquivo']):
+            return None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(info['arquivo'], 'r')).read_all()
+            df = table.to_pandas(split_blocks=True)
+            if info.get('geo'):
+                wkb = df.pop("geometry")
+                geometria = gpd.GeoSeries.from_wkb(wkb.to_numpy(), index=df.index, crs=info.get('crs'))
+                return gpd.GeoDataFrame(df, geometry=geometria)
+            return df
+        except Exception as e:
+            print(f"⚠️ Erro ao ler etapa '{nome}': {e}")
+            return None
+
     def find_folder_by_path(self, folder_path):
         """Encontra pastas pelo nome"""
         print("🔍 Buscando pastas no Google Drive...")
@@ -67,19 +241,23 @@ class FocosCalorProcessor:
         print(f"📋 Mapeamento final: {folders_map}")
         return folders_map
         
-    def download_all_csv_files(self, folder_id):
-        """Baixa TODOS os arquivos CSV da pasta, independente do tamanho"""
-        print("📥 Baixando TODOS os arquivos CSV...")
-        
-        # Buscar TODOS os arquivos CSV
+    def list_csv_files(self, folder_id):
+        """Lista TODOS os arquivos CSV da pasta, com data de modificação"""
         query = f"'{folder_id}' in parents and name contains '.csv' and trashed=false"
         results = self.drive_service.files().list(
             q=query,
-            fields="files(id, name, size)",
+            fields="files(id, name, size, modifiedTime)",
             pageSize=1000  # Aumentar limite para pegar todos
         ).execute()
+        return results.get('files', [])
+        
+    def download_all_csv_files(self, folder_id, files=None):
+        """Baixa TODOS os arquivos CSV da pasta, independente do tamanho"""
+        print("📥 Baixando TODOS os arquivos CSV...")
         
-        files = results.get('files', [])
+        # Buscar TODOS os arquivos CSV
+        if files is None:
+            files = self.list_csv_files(folder_id)
         downloaded_files = []
         
         print(f"🔍 Encontrados {len(files)} arquivos CSV")
@@ -198,6 +376,21 @@ class FocosCalorProcessor:
         print(f"✅ GeoDataFrame criado: {len(gdf_focos)} pontos válidos")
         return gdf_focos
         
+    def normalize_object_columns(self, df):
+        """Converte para texto as colunas object que não são só texto (ex.: int e str)
+        
+        A inferência de tipos em blocos do read_csv pode misturar tipos em uma
+        mesma coluna, o que o Arrow não aceita. Valores nulos são mantidos.
+        """
+        for col in df.columns:
+            if col == "geometry" or df[col].dtype != object:
+                continue
+            valores = df[col].dropna()
+            if not valores.map(lambda valor: isinstance(valor, str)).all():
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+                print(f"   ⚠️ Coluna '{col}' com tipos mistos convertida para texto")
+        return df
+        
     def download_spatial_references(self, ref_folder_id):
         """Baixa TODAS as referências espaciais disponíveis"""
         print("📍 Baixando referências espaciais...")
@@ -303,12 +496,13 @@ class FocosCalorProcessor:
             print(f"      ❌ Erro ao baixar shapefile {base_name}: {e}")
             return False
             
-    def apply_spatial_joins(self, gdf_focos, spatial_refs):
+    def apply_spatial_joins(self, gdf_focos, spatial_refs, bbox=None, cache_tag=None,
+                            source_checksums=None):
         """Aplica joins espaciais OBRIGATÓRIOS conforme script original"""
         print("🔗 APLICANDO JOINS ESPACIAIS...")
         
         crs_alvo = "EPSG:4326"
-        gdf_result = gdf_focos.copy()
+        gdf_result = gdf_focos
         initial_columns = set(gdf_result.columns)
         
         # Configurar mapeamento de colunas conforme script original
@@ -321,6 +515,9 @@ class FocosCalorProcessor:
             "zee": "Nome_Atual"
         }
         
+        # Amostra de focos para medir o ganho do pré-processamento
+        amostra_focos = gdf_focos[["geometry"]].head(BENCHMARK_SAMPLE)
+        
         # Carregar e aplicar cada referência espacial
         joins_aplicados = 0
         for chave in ['uf', 'municipios', 'biomas', 'terras_indigenas', 'uso_solo', 'zee']:
@@ -329,33 +526,21 @@ class FocosCalorProcessor:
                 print(f"   🔗 Processando: {chave}")
                 
                 try:
-                    # Carregar shapefile
-                    try:
-                        gdf_ref = gpd.read_file(caminho, encoding='utf-8')
-                    except UnicodeDecodeError:
-                        gdf_ref = gpd.read_file(caminho, encoding='latin1')
-                    
-                    print(f"      📊 Carregado: {len(gdf_ref)} geometrias")
-                    
-                    # Ajustar CRS
-                    if gdf_ref.crs is not None and gdf_ref.crs != crs_alvo:
-                        gdf_ref = gdf_ref.to_crs(crs_alvo)
-                    
-                    # Selecionar colunas relevantes
-                    columns_to_keep = ["geometry"]
+                    # Colunas relevantes da referência
                     expected_columns = column_mapping.get(chave, [])
                     if isinstance(expected_columns, str):
                         expected_columns = [expected_columns]
                     
-                    for col in expected_columns:
-                        if col in gdf_ref.columns:
-                            columns_to_keep.append(col)
-                    
-                    gdf_ref = gdf_ref[columns_to_keep]
+                    # Carregar shapefile pré-processado (geometrias válidas e simplificadas)
+                    gdf_ref = self.load_reference_layer(
+                        chave, caminho, crs_alvo, expected_columns, amostra_focos,
+                        bbox=bbox, cache_tag=cache_tag,
+                        source_checksum=(source_checksums or {}).get(chave)
+                    )
                     
                     # Limpar índices anteriores
                     if "index_right" in gdf_result.columns:
-                        gdf_result.drop(columns=["index_right"], inplace=True)
+                        gdf_result = gdf_result.drop(columns=["index_right"])
                     
                     # Aplicar join espacial
                     antes_join = len(gdf_result.columns)
@@ -374,7 +559,7 @@ class FocosCalorProcessor:
         
         # Limpeza final
         if "index_right" in gdf_result.columns:
-            gdf_result.drop(columns=["index_right"], inplace=True)
+            gdf_result = gdf_result.drop(columns=["index_right"])
             
         final_columns = set(gdf_result.columns)
         new_columns = final_columns - initial_columns
@@ -387,6 +572,198 @@ class FocosCalorProcessor:
             
         return gdf_result
         
+    def compute_source_checksum(self, shp_path):
+        """Calcula o checksum SHA-256 de todos os arquivos do shapefile"""
+        shp_dir = os.path.dirname(shp_path)
+        base_name = os.path.basename(shp_path).replace('.shp', '')
+        sha = hashlib.sha256()
+        
+        for file in sorted(os.listdir(shp_dir)):
+            if os.path.splitext(file)[0] == base_name:
+                sha.update(file.encode('utf-8'))
+                with open(os.path.join(shp_dir, file), 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        sha.update(chunk)
+        return sha.hexdigest()
+        
+    def read_shapefile(self, caminho, bbox=None):
+        """Lê um shapefile tentando UTF-8 e depois Latin-1"""
+        try:
+            return gpd.read_file(caminho, encoding='utf-8', bbox=bbox)
+        except UnicodeDecodeError:
+            return gpd.read_file(caminho, encoding='latin1', bbox=bbox)
+            
+    def load_reference_layer(self, chave, caminho, crs_alvo, expected_columns, amostra_focos,
+                             bbox=None, cache_tag=None, source_checksum=None):
+        """Carrega uma referência espacial pré-processada, usando o cache por checksum
+        
+        Com bbox (minx, miny, maxx, maxy em crs_alvo) apenas as geometrias que
+        intersectam o retângulo são lidas e recortadas por ele, e o cache fica
+        em uma subpasta cache_tag. source_checksum evita recalcular o checksum
+        do shapefile completo quando ele já é conhecido.
+        """
+        simplificar = chave not in COVERAGE_LAYERS
+        params = (f"{crs_alvo}|{sorted(expected_columns)}|{SIMPLIFY_TOLERANCE if simplificar else 0}"
+                  f"|{PRECISION_GRID}|{bbox}")
+        if source_checksum is None:
+            source_checksum = self.compute_source_checksum(caminho)
+        checksum = hashlib.sha256(f"{source_checksum}|{params}".encode('utf-8')).hexdigest()
+        cache_dir = os.path.join(CACHE_DIR, 'estados', cache_tag) if cache_tag else CACHE_DIR
+        cache_path = os.path.join(cache_dir, f"{chave}_{checksum[:16]}.gpkg")
+        meta_path = cache_path.replace('.gpkg', '.json')
+        
+        if os.path.exists(cache_path) and os.path.exists(meta_path):
+            try:
+                gdf_ref = gpd.read_file(cache_path)
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+                print(f"      ♻️ Cache: {len(gdf_ref)} geometrias ({checksum[:16]})")
+                self.report_preprocessing_stats(stats)
+                self.cache_utilizado.update([cache_path, meta_path])
+                return gdf_ref
+            except Exception as e:
+                print(f"      ⚠️ Cache inválido, reprocessando: {e}")
+        
+        # Carregar shapefile (filtrado pelo bbox, se informado)
+        filtro = gpd.GeoSeries([shapely.box(*bbox)], crs=crs_alvo) if bbox is not None else None
+        gdf_ref = self.read_shapefile(caminho, bbox=filtro)
+        print(f"      📊 Carregado: {len(gdf_ref)} geometrias")
+        
+        # Ajustar CRS
+        if gdf_ref.crs is not None and gdf_ref.crs != crs_alvo:
+            gdf_ref = gdf_ref.to_crs(crs_alvo)
+        
+        columns_to_keep = ["geometry"] + [col for col in expected_columns if col in gdf_ref.columns]
+        gdf_ref = gdf_ref[columns_to_keep]
+        
+        # O filtro da leitura não recorta: camadas dissolvidas viriam inteiras
+        if bbox is not None:
+            gdf_ref = gdf_ref.set_geometry(gdf_ref.clip_by_rect(*bbox))
+            gdf_ref = gdf_ref[~gdf_ref.geometry.is_empty]
+            print(f"      ✂️ Recortado pelo retângulo: {len(gdf_ref)} geometrias")
+        
+        gdf_processado, stats = self.preprocess_reference_layer(gdf_ref, amostra_focos, simplificar)
+        self.report_preprocessing_stats(stats)
+        
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            gdf_processado.to_file(cache_path, driver="GPKG")
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, indent=2)
+            self.cache_utilizado.update([cache_path, meta_path])
+        except Exception as e:
+            print(f"      ⚠️ Erro ao salvar cache de {chave}: {e}")
+            
+        return gdf_processado
+        
+    def preprocess_reference_layer(self, gdf_ref, amostra_focos, simplificar=True):
+        """Corrige, simplifica e reduz a precisão das geometrias de referência
+        
+        A simplificação é feita polígono a polígono e não preserva bordas
+        compartilhadas; por isso só é aplicada fora das camadas de cobertura.
+        O ajuste à grade é determinístico por coordenada e mantém as bordas.
+        """
+        geoms = gdf_ref.geometry.to_numpy()
+        vertices_antes = int(shapely.get_num_coordinates(geoms).sum())
+        invalidas = int((~shapely.is_valid(geoms)).sum())
+        
+        # 1. Corrigir geometrias inválidas (vetorizado)
+        geoms = shapely.make_valid(geoms)
+        # 2. Simplificar preservando a topologia de cada polígono
+        if simplificar:
+            geoms = shapely.simplify(geoms, SIMPLIFY_TOLERANCE, preserve_topology=True)
+        # 3. Remover vértices abaixo da precisão relevante
+        geoms = shapely.set_precision(geoms, PRECISION_GRID)
+        
+        gdf_processado = gdf_ref.set_geometry(
+            gpd.GeoSeries(geoms, index=gdf_ref.index, crs=gdf_ref.crs)
+        )
+        vazias = gdf_processado.geometry.is_empty | gdf_processado.geometry.isna()
+        gdf_processado = gdf_processado[~vazias]
+        
+        vertices_depois = int(shapely.get_num_coordinates(gdf_processado.geometry.to_numpy()).sum())
+        
+        # Medir o ganho e o efeito no resultado do join com uma amostra de focos
+        tempo_antes, join_antes = self.run_sample_join(amostra_focos, gdf_ref)
+        tempo_depois, join_depois = self.run_sample_join(amostra_focos, gdf_processado)
+        speedup = tempo_antes / tempo_depois if tempo_depois > 0 else None
+        
+        stats = {
+            "geometrias": len(gdf_processado),
+            "simplificada": simplificar,
+            "invalidas_corrigidas": invalidas,
+            "vazias_removidas": int(vazias.sum()),
+            "vertices_antes": vertices_antes,
+            "vertices_depois": vertices_depois,
+            "tempo_join_antes": tempo_antes,
+            "tempo_join_depois": tempo_depois,
+            "speedup": speedup,
+            "focos_amostra": len(amostra_focos) if amostra_focos is not None else 0,
+            "focos_alterados": self.count_changed_matches(join_antes, join_depois)
+        }
+        return gdf_processado, stats
+        
+    def run_sample_join(self, amostra_focos, gdf_ref):
+        """Executa um join espacial com a amostra de focos e mede o tempo"""
+        if amostra_focos is None or amostra_focos.empty:
+            return 0.0, None
+        try:
+            inicio = time.perf_counter()
+            resultado = amostra_focos.sjoin(gdf_ref, how="left", predicate="within")
+            return time.perf_counter() - inicio, resultado
+        except Exception as e:
+            print(f"      ⚠️ Erro ao medir join: {e}")
+            return 0.0, None
+            
+    def count_changed_matches(self, join_antes, join_depois):
+        """Conta os focos cujas geometrias correspondentes mudaram após o pré-processamento"""
+        if join_antes is None or join_depois is None:
+            return None
+        
+        def correspondencias(resultado):
+            return resultado["index_right"].groupby(level=0).agg(
+                lambda indices: tuple(sorted(indices.dropna()))
+            )
+        
+        antes = correspondencias(join_antes)
+        depois = correspondencias(join_depois).reindex(antes.index)
+        return int((antes != depois).sum())
+            
+    def report_preprocessing_stats(self, stats):
+        """Exibe o resumo do pré-processamento de uma referência"""
+        vertices_antes = stats.get("vertices_antes", 0)
+        vertices_depois = stats.get("vertices_depois", 0)
+        variacao = (vertices_depois / vertices_antes - 1) * 100 if vertices_antes else 0
+        
+        print(f"      🛠️ Geometrias corrigidas: {stats.get('invalidas_corrigidas', 0)}, "
+              f"vazias removidas: {stats.get('vazias_removidas', 0)}")
+        print(f"      📉 Vértices: {vertices_antes} → {vertices_depois} ({variacao:+.1f}%)")
+        if stats.get("speedup"):
+            print(f"      ⚡ Speedup do join: {stats['speedup']:.2f}x "
+                  f"({stats['tempo_join_antes']:.3f}s → {stats['tempo_join_depois']:.3f}s)")
+        if stats.get("focos_alterados") is not None:
+            print(f"      🔍 Focos com join alterado: {stats['focos_alterados']}/{stats.get('focos_amostra', 0)}")
+        
+    def prune_reference_cache(self):
+        """Remove do cache as referências não utilizadas nesta execução"""
+        if not self.cache_utilizado or not os.path.isdir(CACHE_DIR):
+            return
+            
+        utilizados = {os.path.abspath(path) for path in self.cache_utilizado}
+        removidos = 0
+        for raiz, _, arquivos in os.walk(CACHE_DIR):
+            for arquivo in arquivos:
+                path = os.path.abspath(os.path.join(raiz, arquivo))
+                if arquivo.endswith(('.gpkg', '.json')) and path not in utilizados:
+                    try:
+                        os.remove(path)
+                        removidos += 1
+                    except Exception as e:
+                        print(f"   ⚠️ Erro ao remover {arquivo} do cache: {e}")
+                        
+        if removidos:
+            print(f"🧹 Cache de referências: {removidos} arquivos antigos removidos")
+        
     def export_results(self, gdf_final, results_folder_id):
         """Exporta resultado com estratégia híbrida: arquivo principal + backup"""
         print("💾 EXPORTANDO RESULTADOS - ESTRATÉGIA HÍBRIDA...")
@@ -609,14 +986,278 @@ class FocosCalorProcessor:
                 file_path = os.path.join(shp_dir, file)
                 self.upload_to_drive(file_path, folder_id, file)
                 
-    def cleanup(self):
-        """Remove arquivos temporários"""
+    def cleanup(self, manter=False):
+        """Remove arquivos temporários (ou os mantém para --resume)"""
+        if manter:
+            print(f"💾 Execução preservada em {self.temp_dir} - use --resume para retomar")
+            return
         try:
             shutil.rmtree(self.temp_dir)
             print(f"🧹 Limpeza concluída")
         except Exception as e:
             print(f"⚠️ Erro na limpeza: {e}")
 
+    def prepare_focos(self, focos_folder_id, csv_files_info=None):
+        """Baixa, concatena e limpa os focos, retomando da última etapa salva"""
+        gdf_focos = self.load_stage('focos_geo')
+        if gdf_focos is not None:
+            print(f"♻️ Etapa 'focos_geo' retomada: {len(gdf_focos)} pontos")
+            return gdf_focos
+            
+        # Baixar TODOS os arquivos CSV
+        csv_files = self.download_all_csv_files(focos_folder_id, csv_files_info)
+        if not csv_files:
+            print("❌ ERRO CRÍTICO: Nenhum arquivo CSV baixado!")
+            return None
+            
+        # Carregar e concatenar TODOS os dados
+        df_focos = self.load_and_concat_all_data(csv_files)
+        if df_focos is None:
+            print("❌ ERRO CRÍTICO: Nenhum dado válido carregado!")
+            return None
+            
+        # Criar GeoDataFrame
+        gdf_focos = self.clean_and_prepare_geodataframe(df_focos)
+        del df_focos
+        if gdf_focos is None:
+            print("❌ ERRO CRÍTICO: Falha ao criar GeoDataFrame!")
+            return None
+        self.save_stage('focos_geo', gdf_focos)
+        return gdf_focos
+        
+    def get_spatial_references(self, ref_folder_id):
+        """Baixa as referências espaciais, reaproveitando os arquivos de uma execução retomada"""
+        info = self.manifest.get('referencias')
+        if info and all(os.path.exists(path) for path in info['arquivos'].values()):
+            print(f"♻️ Referências retomadas: {list(info['arquivos'].keys())}")
+            return info['arquivos']
+            
+        spatial_refs = self.download_spatial_references(ref_folder_id)
+        if spatial_refs:
+            self.mark_stage('referencias', {"arquivos": spatial_refs})
+        return spatial_refs
+        
+    def partition_by_uf(self, csv_files, spatial_refs):
+        """Particiona os focos por UF à medida que cada CSV é carregado
+        
+        Cada arquivo é limpo, associado à UF pelo join com a camada de estados
+        e gravado em partes Arrow por UF, sem montar o conjunto nacional em
+        memória. Retorna {uf: (partes, bbox)}, onde bbox é o retângulo do
+        estado usado para recortar as referências.
+        """
+        print("🗺️ PARTICIONANDO FOCOS POR UF...")
+        
+        gdf_uf = self.load_reference_layer('uf', spatial_refs['uf'], "EPSG:4326", ["NM_UF"], None)
+        if "NM_UF" not in gdf_uf.columns:
+            print("❌ Coluna 'NM_UF' não encontrada na camada de UFs!")
+            return {}
+        
+        bounds_uf = gdf_uf.dissolve(by="NM_UF").bounds
+        bounds_uf[["minx", "miny"]] -= BBOX_MARGIN
+        bounds_uf[["maxx", "maxy"]] += BBOX_MARGIN
+        partition_dir = os.path.join(self.temp_dir, 'nacional', 'particoes')
+        
+        partitions = {}
+        total_focos = 0
+        sem_uf = 0
+        for i, csv_file in enumerate(csv_files):
+            file_name = os.path.basename(csv_file)
+            try:
+                df = pd.read_csv(csv_file)
+            except pd.errors.EmptyDataError:
+                print(f"⚠️ {file_name}: arquivo vazio (EmptyDataError)")
+                continue
+            except Exception as e:
+                print(f"❌ {file_name}: erro - {e}")
+                continue
+                
+            if df.empty:
+                print(f"⚠️ {file_name}: arquivo vazio")
+                continue
+                
+            gdf_parte = self.clean_and_prepare_geodataframe(df)
+            del df
+            if gdf_parte is None:
+                print(f"❌ {file_name}: falha ao criar GeoDataFrame")
+                continue
+                
+            gdf_parte = gdf_parte.sjoin(gdf_uf, how="left", predicate="within")
+            gdf_parte = gdf_parte.drop(columns=["index_right"])
+            self.normalize_object_columns(gdf_parte)
+            
+            # Uma falha de gravação descarta apenas este arquivo
+            escritos = []
+            try:
+                for uf, gdf_estado in gdf_parte.dropna(subset=["NM_UF"]).groupby("NM_UF"):
+                    uf_dir = os.path.join(partition_dir, slugify(uf))
+                    os.makedirs(uf_dir, exist_ok=True)
+                    partition_path = os.path.join(uf_dir, f"parte_{i:04d}.arrow")
+                    gdf_estado.to_feather(partition_path, compression='uncompressed')
+                    escritos.append((uf, partition_path))
+            except Exception as e:
+                print(f"❌ {file_name}: erro ao gravar partição - {e}")
+                for _, partition_path in escritos:
+                    os.remove(partition_path)
+                continue
+                
+            for uf, partition_path in escritos:
+                if uf not in partitions:
+                    partitions[uf] = ([], tuple(float(v) for v in bounds_uf.loc[uf]))
+                partitions[uf][0].append(partition_path)
+                
+            sem_uf += int(gdf_parte["NM_UF"].isna().sum())
+            total_focos += len(gdf_parte)
+            print(f"✅ {file_name}: {len(gdf_parte)} focos particionados")
+            
+        if sem_uf:
+            print(f"   ⚠️ {sem_uf} focos fora de qualquer UF (ignorados)")
+        print(f"✅ {total_focos} focos em {len(partitions)} UFs")
+        return partitions
+        
+    def load_partitions(self):
+        """Retoma as partições por UF registradas no manifesto; None se não houver"""
+        info = self.manifest.get('particoes')
+        if not info:
+            return None
+        partitions = {
+            uf: (particao['arquivos'], tuple(particao['bbox']))
+            for uf, particao in info['ufs'].items()
+        }
+        if not all(os.path.exists(path) for paths, _ in partitions.values() for path in paths):
+            print("⚠️ Partições incompletas no disco, reparticionando")
+            return None
+        return partitions
+        
+    def build_national_rollup(self, resumos, output_dir):
+        """Consolida os resumos estaduais em um ranking nacional"""
+        print("🇧🇷 CONSOLIDANDO RESUMO NACIONAL...")
+        
+        df_resumo = pd.DataFrame(resumos).drop(columns=["arquivo", "cache_referencias"], errors="ignore")
+        df_resumo = df_resumo.sort_values("total_focos", ascending=False).reset_index(drop=True)
+        df_resumo.insert(0, "ranking", df_resumo.index + 1)
+        
+        total = int(df_resumo["total_focos"].sum())
+        df_resumo["percentual_nacional"] = (df_resumo["total_focos"] / total * 100).round(2) if total else 0.0
+        
+        excel_path = os.path.join(output_dir, "focos_resumo_nacional.xlsx")
+        df_resumo.drop(columns=["focos_por_bioma"]).to_excel(excel_path, index=False)
+        
+        resumo_nacional = {
+            "last_updated": datetime.now().isoformat(),
+            "total_focos": total,
+            "total_ufs": len(df_resumo),
+            "source": "INPE",
+            "processor": "IMESC",
+            "estados": df_resumo.astype(object).where(df_resumo.notna(), None).to_dict(orient="records")
+        }
+        
+        os.makedirs('data', exist_ok=True)
+        with open('data/resumo_nacional.json', 'w', encoding='utf-8') as f:
+            json.dump(resumo_nacional, f, indent=2, ensure_ascii=False)
+            
+        print(f"✅ Resumo nacional: {total} focos em {len(df_resumo)} UFs")
+        print(f"📁 Arquivo disponível em: data/resumo_nacional.json")
+        return excel_path
+        
+    def process_national_data(self, max_workers=None):
+        """PROCESSO NACIONAL - Estados processados de forma independente e em paralelo"""
+        print("🇧🇷 INICIANDO PROCESSAMENTO NACIONAL DE FOCOS DE CALOR")
+        
+        try:
+            folders = self.find_folder_by_path("")
+            focos_folder_id = folders.get("1. Focos")
+            ref_folder_id = folders.get("2. Referências Espaciais")
+            results_folder_id = folders.get("3. Resultados")
+            
+            if not focos_folder_id or not ref_folder_id:
+                print("❌ ERRO CRÍTICO: Pastas de focos/referências não encontradas!")
+                return False
+                
+            csv_files_info = self.list_csv_files(focos_folder_id)
+            self.check_resume_inputs(csv_files_info)
+            
+            spatial_refs = self.get_spatial_references(ref_folder_id)
+            if 'uf' not in spatial_refs:
+                print("❌ ERRO CRÍTICO: Camada de UFs necessária para o modo nacional!")
+                return False
+                
+            partitions = self.load_partitions()
+            if partitions is not None:
+                print(f"♻️ Partições retomadas: {len(partitions)} UFs")
+            else:
+                csv_files = self.download_all_csv_files(focos_folder_id, csv_files_info)
+                if not csv_files:
+                    print("❌ ERRO CRÍTICO: Nenhum arquivo CSV baixado!")
+                    return False
+                    
+                # Focos particionados arquivo a arquivo, sem o conjunto nacional em memória
+                partitions = self.partition_by_uf(csv_files, spatial_refs)
+                if not partitions:
+                    print("❌ ERRO CRÍTICO: Nenhuma partição estadual gerada!")
+                    return False
+                self.mark_stage('particoes', {
+                    "ufs": {uf: {"arquivos": paths, "bbox": list(bbox)} for uf, (paths, bbox) in partitions.items()}
+                })
+                
+            # Cada worker recorta as próprias referências pelo bbox do estado
+            refs_estaduais = {k: v for k, v in spatial_refs.items() if k != 'uf'}
+            checksums = {k: self.compute_source_checksum(v) for k, v in refs_estaduais.items()}
+            output_dir = os.path.join(self.temp_dir, 'nacional', 'resultados')
+            os.makedirs(output_dir, exist_ok=True)
+            
+            # UFs já concluídas em uma execução retomada não são reprocessadas
+            resumos = []
+            pendentes = {}
+            for uf, (partition_paths, bbox) in partitions.items():
+                info = self.manifest.get(f"estado_{slugify(uf)}")
+                if info and os.path.exists(info['resumo']['arquivo']):
+                    resumos.append(info['resumo'])
+                    print(f"   ♻️ {uf}: retomado ({info['resumo']['total_focos']} focos)")
+                else:
+                    pendentes[uf] = (partition_paths, bbox)
+            
+            print(f"⚙️ Processando {len(pendentes)} UFs com {max_workers or os.cpu_count()} workers...")
+            if pendentes:
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {
+                        executor.submit(
+                            process_state_partition, uf, partition_paths, bbox, refs_estaduais, checksums, output_dir
+                        ): uf
+                        for uf, (partition_paths, bbox) in pendentes.items()
+                    }
+                    for future in as_completed(futures):
+                        uf = futures[future]
+                        try:
+                            resumo = future.result()
+                            resumos.append(resumo)
+                            self.mark_stage(f"estado_{slugify(uf)}", {"resumo": resumo})
+                            print(f"   ✅ {uf}: {resumo['total_focos']} focos processados")
+                        except Exception as e:
+                            print(f"   ❌ Erro ao processar {uf}: {e}")
+                        
+            if not resumos:
+                print("❌ ERRO CRÍTICO: Nenhuma UF processada!")
+                return False
+                
+            # Cache usado pelos workers (inclusive o das UFs retomadas) não deve ser removido
+            for resumo in resumos:
+                self.cache_utilizado.update(resumo.get('cache_referencias', []))
+                
+            rollup_path = self.build_national_rollup(resumos, output_dir)
+            
+            if results_folder_id:
+                print("📤 Enviando resultados estaduais e resumo nacional...")
+                for resumo in resumos:
+                    self.update_main_file(resumo['arquivo'], results_folder_id, os.path.basename(resumo['arquivo']))
+                self.update_main_file(rollup_path, results_folder_id, os.path.basename(rollup_path))
+                
+            print(f"🎉 PROCESSO NACIONAL CONCLUÍDO: {len(resumos)}/{len(partitions)} UFs")
+            return len(resumos) == len(partitions)
+            
+        except Exception as e:
+            print(f"❌ ERRO CRÍTICO no processamento nacional: {e}")
+            return False
+
     def process_heat_focus_data(self):
         """PROCESSO PRINCIPAL - GARANTIR PROCESSAMENTO COMPLETO"""
         print("🔥 INICIANDO PROCESSAMENTO COMPLETO DE FOCOS DE CALOR")
@@ -633,37 +1274,35 @@ class FocosCalorProcessor:
                 print("❌ ERRO CRÍTICO: Pasta de focos não encontrada!")
                 return False
                 
-            # 2. Baixar TODOS os arquivos CSV
-            csv_files = self.download_all_csv_files(focos_folder_id)
-            if not csv_files:
-                print("❌ ERRO CRÍTICO: Nenhum arquivo CSV baixado!")
-                return False
-                
-            # 3. Carregar e concatenar TODOS os dados
-            df_focos = self.load_and_concat_all_data(csv_files)
-            if df_focos is None:
-                print("❌ ERRO CRÍTICO: Nenhum dado válido carregado!")
-                return False
-                
-            # 4. Criar GeoDataFrame
-            gdf_focos = self.clean_and_prepare_geodataframe(df_focos)
-            if gdf_focos is None:
-                print("❌ ERRO CRÍTICO: Falha ao criar GeoDataFrame!")
-                return False
+            # Etapas salvas só valem para os mesmos CSVs do Drive
+            csv_files_info = self.list_csv_files(focos_folder_id)
+            self.check_resume_inputs(csv_files_info)
                 
-            # 5. Processar referências espaciais (OBRIGATÓRIO)
-            if ref_folder_id:
-                print("📍 BAIXANDO REFERÊNCIAS ESPACIAIS...")
-                spatial_refs = self.download_spatial_references(ref_folder_id)
-                if spatial_refs:
-                    print("🔗 APLICANDO JOINS ESPACIAIS...")
-                    gdf_final = self.apply_spatial_joins(gdf_focos, spatial_refs)
+            # 2-5. Focos qualificados (retomados da última etapa salva, se houver)
+            gdf_final = self.load_stage('focos_qualificados')
+            if gdf_final is not None:
+                print(f"♻️ Etapa 'focos_qualificados' retomada: {len(gdf_final)} registros")
+            else:
+                # 2-4. Baixar, concatenar e limpar TODOS os dados
+                gdf_focos = self.prepare_focos(focos_folder_id, csv_files_info)
+                if gdf_focos is None:
+                    return False
+                    
+                # 5. Processar referências espaciais (OBRIGATÓRIO)
+                if ref_folder_id:
+                    print("📍 BAIXANDO REFERÊNCIAS ESPACIAIS...")
+                    spatial_refs = self.get_spatial_references(ref_folder_id)
+                    if spatial_refs:
+                        print("🔗 APLICANDO JOINS ESPACIAIS...")
+                        gdf_final = self.apply_spatial_joins(gdf_focos, spatial_refs)
+                        del gdf_focos
+                        self.save_stage('focos_qualificados', gdf_final)
+                    else:
+                        print("⚠️ NENHUMA referência espacial baixada - usando dados básicos")
+                        gdf_final = gdf_focos
                 else:
-                    print("⚠️ NENHUMA referência espacial baixada - usando dados básicos")
+                    print("⚠️ Pasta de referências não encontrada - usando dados básicos")
                     gdf_final = gdf_focos
-            else:
-                print("⚠️ Pasta de referências não encontrada - usando dados básicos")
-                gdf_final = gdf_focos
                 
             # 6. Exportar resultados
             success = self.export_results(gdf_final, results_folder_id)
@@ -673,17 +1312,73 @@ class FocosCalorProcessor:
             print(f"❌ ERRO CRÍTICO no processamento: {e}")
             return False
 
+def slugify(nome):
+    """Converte um nome (ex.: 'Maranhão') em um nome de arquivo seguro"""
+    nome = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^A-Za-z0-9]+', '_', nome).strip('_').lower()
+
+def process_state_partition(uf, partition_paths, bbox, spatial_refs, source_checksums, output_dir):
+    """Worker do modo nacional: aplica os joins de uma UF e grava o resultado"""
+    slug = slugify(uf)
+    state_dir = os.path.join(output_dir, slug)
+    os.makedirs(state_dir, exist_ok=True)
+    
+    processor = FocosCalorProcessor(credentials_path=None, temp_dir=state_dir)
+    gdf_focos = pd.concat(
+        [gpd.read_feather(path) for path in partition_paths], ignore_index=True
+    )
+    gdf_final = processor.apply_spatial_joins(
+        gdf_focos, spatial_refs, bbox=bbox, cache_tag=slug, source_checksums=source_checksums
+    )
+    
+    excel_path = os.path.join(output_dir, f"focos_qualificados_{slug}.xlsx")
+    gdf_final.drop(columns="geometry").to_excel(excel_path, index=False)
+    
+    resumo = {
+        "uf": uf,
+        "total_focos": int(len(gdf_final)),
+        "municipios_afetados": int(gdf_final["NM_MUN"].nunique()) if "NM_MUN" in gdf_final.columns else None,
+        "focos_terras_indigenas": int(gdf_final["terrai_nom"].notna().sum()) if "terrai_nom" in gdf_final.columns else None,
+        "focos_por_bioma": (
+            {str(k): int(v) for k, v in gdf_final["Bioma"].value_counts().items()}
+            if "Bioma" in gdf_final.columns else {}
+        ),
+        "arquivo": excel_path,
+        "cache_referencias": sorted(processor.cache_utilizado)
+    }
+    return resumo
+
+def parse_args():
+    """Lê os argumentos de linha de comando"""
+    parser = argparse.ArgumentParser(description="Processamento de focos de calor")
+    parser.add_argument('--nacional', action='store_true',
+                        help="Processa todo o Brasil, particionando os dados por UF")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Número de processos paralelos no modo nacional (padrão: nº de CPUs)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Retoma uma execução que falhou a partir da última etapa concluída")
+    return parser.parse_args()
+
 def main():
     """Função principal"""
+    args = parse_args()
     processor = None
+    success = False
     try:
         print("🚀 INICIANDO PROCESSAMENTO AUTOMATIZADO - VERSÃO COMPLETA")
         print(f"🕐 Timestamp: {datetime.now().isoformat()}")
         
-        processor = FocosCalorProcessor()
-        success = processor.process_heat_focus_data()
+        processor = FocosCalorProcessor(resume=args.resume)
+        if args.nacional:
+            success = processor.process_national_data(max_workers=args.workers)
+        else:
+            success = processor.process_heat_focus_data()
         
-        if success:
+        if success and args.nacional:
+            print("🎉 PROCESSAMENTO NACIONAL CONCLUÍDO COM SUCESSO!")
+            print("📊 Arquivos focos_qualificados_<uf>.xlsx e focos_resumo_nacional.xlsx atualizados")
+            print("🔗 Resumo nacional disponível em data/resumo_nacional.json")
+        elif success:
             print("🎉 PROCESSAMENTO CONCLUÍDO COM SUCESSO!")
             print("📊 Arquivo focos_qualificados_atual.xlsx atualizado")
             print("🔗 Link público disponível em data/current_data_link.json")
@@ -691,13 +1386,16 @@ def main():
         else:
             print("❌ PROCESSAMENTO FALHOU!")
             
+        if success:
+            processor.prune_reference_cache()
+            
     except Exception as e:
         print(f"❌ ERRO FATAL: {e}")
         raise
         
     finally:
         if processor:
-            processor.cleanup()
+            processor.cleanup(manter=not success)
 
 if __name__ == "__main__":
     main()